@@ -9,29 +9,44 @@ zip_inner_ext_counter = Counter()
 zip_error_files = []
 
 def get_extension(filename):
-    if "." not in filename:
+    ext = os.path.splitext(filename)[1]
+    if not ext:
         return "(no extension)"
-    return filename.rsplit(".", 1)[-1].lower()
-
-for root, _, files in os.walk(SOURCE_DIR):
-    for name in files:
-        path = os.path.join(root, name)
-        ext = get_extension(name)
-        outer_ext_counter[ext] += 1
-
-        if ext == "zip":
-            try:
-                with zipfile.ZipFile(path, "r") as z:
-                    for zinfo in z.infolist():
-                        if zinfo.is_dir():
-                            continue
-                        inner_name = os.path.basename(zinfo.filename)
-                        if not inner_name:
-                            continue
-                        inner_ext = get_extension(inner_name)
-                        zip_inner_ext_counter[inner_ext] += 1
-            except Exception as e:
-                zip_error_files.append(f"{path} | {e}")
+    return ext[1:].lower()
+
+def iter_files(root):
+    # 和 os.walk 一樣先列本層檔案再往下走, 檔案型別直接取自 scandir 的 DirEntry
+    dirs = []
+    try:
+        with os.scandir(root) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.path)
+                elif e.is_file():
+                    yield e
+    except OSError:
+        return
+    for d in dirs:
+        yield from iter_files(d)
+
+for entry in iter_files(SOURCE_DIR):
+    path = entry.path
+    ext = get_extension(entry.name)
+    outer_ext_counter[ext] += 1
+
+    if ext == "zip":
+        try:
+            with zipfile.ZipFile(path, "r") as z:
+                for zinfo in z.infolist():
+                    if zinfo.is_dir():
+                        continue
+                    inner_name = os.path.basename(zinfo.filename)
+                    if not inner_name:
+                        continue
+                    inner_ext = get_extension(inner_name)
+                    zip_inner_ext_counter[inner_ext] += 1
+        except Exception as e:
+            zip_error_files.append(f"{path} | {e}")
 
 print("\n=== 外層檔案副檔名統計 ===")
 for ext, count in outer_ext_counter.most_common():
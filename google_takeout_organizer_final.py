@@ -1,16 +1,33 @@
 import os
+import sys
 import zipfile
 import json
 import shutil
+import errno
 import re
 import io
+import mmap
 import contextlib
+import logging
+import threading
+import functools
+import struct
 import subprocess
-from datetime import datetime
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 import exifread
 import folium
 import reverse_geocoder as rg
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+try:
+    import orjson  # 有裝就用, 大型 JSON 的讀寫快很多
+except ImportError:
+    orjson = None
 
 import time
 
@@ -18,79 +35,347 @@ import time
 SOURCE_DIR = r"source"
 TARGET_DIR = r"final"
 TMP_DIR = r"C:\tmp\TakeoutTmp"
+# True: 目的地和來源在同一個磁碟時用 hard link 取代複製 (改動其中一邊另一邊也會變)
+USE_HARDLINK = False
 
 MEDIA_EXT = (".jpg", ".jpeg", ".png", ".mp4", ".mov",".heic"
                  , ".heif", ".avi", ".mkv", ".wmv", ".3gp"
                  , ".gif", ".tiff", ".webp", ".cr2")
+MEDIA_SET = frozenset(MEDIA_EXT)
+# exifread 不支援的影片格式, 不必解析就知道結果
+VIDEO_SET = frozenset((".mp4", ".mov", ".avi", ".mkv", ".wmv", ".3gp"))
+
+COPY_CHUNK = 1024 * 1024
+REPORT_BUF = 1024 * 1024
+# exifread 讀到這個 tag 就停止掃描所在的 IFD (比對的是不含 IFD 前綴的名稱);
+# 跳過 EXIF IFD 後段, GPS IFD 很小照常讀完
+EXIF_STOP_TAG = "DateTimeOriginal"
+
+# 每個 process 各自開著的 ZipFile, 不必每個檔案重讀 central directory
+_zip_handles = {}
+
+DATE_RE = re.compile(r"(20\d{2})[-_]?(\d{2})[-_]?(\d{2})")
+
+# (dest_dir, 檔名) -> safe_copy 下一個要試的編號
+_next_suffix = {}
+
+# safe_copy 已建立過的目的資料夾
+_made_dirs = set()
+# 目的資料夾 -> 裡面已有的檔名 (normcase)
+_dir_names = {}
+
+# copy_file_range 單次最多複製的位元組數, 以及遇到這些錯誤時改回 shutil.copyfile
+COPY_RANGE_MAX = 1 << 30
+COPY_RANGE_FALLBACK = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.ENOTTY}
+# Linux 的 FICLONE ioctl (reflink); 其他平台沒有
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409) if fcntl and sys.platform.startswith("linux") else None
 
 # ================= GEO =================
 GEO_CACHE_FILE = os.path.join(TARGET_DIR, "geo_cache.json")
 geo_cache = {}
-rg_engine = rg.RGeocoder(mode=1, verbose=False)
+# KD-tree 在第一次查詢時才載入, worker process import 時不用各自建一份
+rg_engine = None
 
 # ================= LOGS =================
-file_format_errors = []
-corrupted_exif_files = []
-unclassified_files = []
-filename_fallback_files = []
-reverse_geocode_failed = []
-ffprobe_failed = []
+file_format_errors = set()
+corrupted_exif_files = set()
+unclassified_files = set()
+filename_fallback_files = set()
+reverse_geocode_failed = set()
+ffprobe_failed = set()
+
+# worker process 內寫入的 log, 每個檔案分析完後取回交給主程序合併
+WORKER_LOGS = (file_format_errors, corrupted_exif_files, unclassified_files,
+               filename_fallback_files, ffprobe_failed)
 
 # ================= STATS =================
-gps_points = []  # for HTML map
+class GpsTable:
+    # for HTML map; 以欄為單位存 (struct of arrays), 大量點位時比 tuple list 省很多記憶體
+    def __init__(self):
+        self.lats = array("d")
+        self.lons = array("d")
+        self.days = array("l")  # date ordinal
+        self.place_ids = array("l")
+        self.places = []
+        self.place_index = {}
+
+    def append(self, lat, lon, dt, place):
+        pid = self.place_index.get(place)
+        if pid is None:
+            pid = self.place_index[place] = len(self.places)
+            self.places.append(place)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.days.append(dt.toordinal())
+        self.place_ids.append(pid)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __iter__(self):
+        for lat, lon, day, pid in zip(self.lats, self.lons, self.days, self.place_ids):
+            yield lat, lon, datetime.fromordinal(day).strftime("%Y-%m-%d"), self.places[pid]
+
+gps_points = GpsTable()
 gps_by_day = defaultdict(set)
 year_city_count = defaultdict(lambda: defaultdict(int))
 city_total_count = defaultdict(int)
 yearly_locations = defaultdict(list)
+pending_gps = []  # (gps, dt, day_dir, path), 全部掃完後再一次反查地點
 
 # ================= UTIL =================
+def load_json(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def dump_json(obj, path):
+    if orjson:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
 def load_geo_cache():
     global geo_cache
     if os.path.exists(GEO_CACHE_FILE):
-        with open(GEO_CACHE_FILE, "r", encoding="utf-8") as f:
-            geo_cache = json.load(f)
+        geo_cache = load_json(GEO_CACHE_FILE)
 
 def save_geo_cache():
-    with open(GEO_CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(geo_cache, f, ensure_ascii=False, indent=2)
+    dump_json(geo_cache, GEO_CACHE_FILE)
+
+def ensure_dir(d):
+    # 建過的目錄記起來, 同一資料夾的後續檔案不用再走 makedirs 的逐層 stat
+    if d not in _made_dirs:
+        os.makedirs(d, exist_ok=True)
+        _made_dirs.add(d)
+
+def fast_copy(src, dst):
+    # 同一個檔案系統又允許的話直接建 hard link, 完全不複製資料 (目的檔和來源共用 mtime)
+    if USE_HARDLINK:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    # 只複製檔案內容再補回 atime/mtime, 省掉 copy2 的 chmod 與額外 stat
+    # Linux 上先試 reflink (btrfs/XFS 的 copy-on-write, 只寫 metadata), 再用 copy_file_range 在 kernel 內複製
+    with open(src, "rb") as fsrc:
+        st = os.fstat(fsrc.fileno())
+        copied = False
+        if FICLONE or hasattr(os, "copy_file_range"):
+            with open(dst, "wb") as fdst:
+                if FICLONE:
+                    try:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+                if not copied and hasattr(os, "copy_file_range"):
+                    try:
+                        while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_RANGE_MAX):
+                            pass
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+    if not copied:
+        shutil.copyfile(src, dst)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+def dir_names(d):
+    # 目的資料夾第一次用到時列一次檔名, 之後檢查同名檔都在記憶體裡比對, 不再逐一 stat
+    # normcase: Windows 的檔名不分大小寫
+    names = _dir_names.get(d)
+    if names is None:
+        ensure_dir(d)
+        names = _dir_names[d] = {os.path.normcase(n) for n in os.listdir(d)}
+    return names
 
 def safe_copy(src, dest_dir):
-    os.makedirs(dest_dir, exist_ok=True)
-    base = os.path.basename(src)
+    names = dir_names(dest_dir)
+    base = os.path.basename(source_name(src))
     name, ext = os.path.splitext(base)
-    dest = os.path.join(dest_dir, base)
-    i = 1
-    while os.path.exists(dest):
-        dest = os.path.join(dest_dir, f"{name}_{i}{ext}")
+    # 從上次用到的編號接著試, 同名檔案很多時不用每次從 _1 開始 stat
+    key = (dest_dir, base)
+    i = _next_suffix.get(key, 0)
+    cand = f"{name}_{i}{ext}" if i else base
+    while os.path.normcase(cand) in names:
         i += 1
-    shutil.copy2(src, dest)
+        cand = f"{name}_{i}{ext}"
+    _next_suffix[key] = i + 1
+    names.add(os.path.normcase(cand))
+    dest = os.path.join(dest_dir, cand)
+    if isinstance(src, tuple):
+        with open_source(src) as fsrc, open(dest, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+    else:
+        fast_copy(src, dest)
 
 def datetime_from_filename(filename):
-    m = re.search(r"(20\d{2})[-_]?(\d{2})[-_]?(\d{2})", filename)
-    if m:
+    # 第一個候選不是合法日期 (例如流水號) 時, 繼續試後面的位置
+    for m in DATE_RE.finditer(filename):
         try:
             return datetime(int(m[1]), int(m[2]), int(m[3]))
-        except:
+        except ValueError:
             pass
     return None
 
+def iter_files(root):
+    # 和 os.walk 一樣先列本層檔案再往下走, 檔案型別直接取自 scandir 的 DirEntry
+    dirs = []
+    try:
+        with os.scandir(root) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.path)
+                elif e.is_file():
+                    yield e
+    except OSError:
+        return
+    for d in dirs:
+        yield from iter_files(d)
+
+# ================= SOURCE =================
+# 來源是一般檔案路徑, 或 ZIP 內的檔案 (zip_path, member), 直接從 ZIP 串流讀取
+def get_zip(zip_path):
+    z = _zip_handles.get(zip_path)
+    if z is None:
+        z = _zip_handles[zip_path] = zipfile.ZipFile(zip_path)
+    return z
+
+def close_zips():
+    for z in _zip_handles.values():
+        z.close()
+    _zip_handles.clear()
+
+def source_name(src):
+    if isinstance(src, tuple):
+        return os.path.join(*src)
+    return src
+
+def open_source(src):
+    if isinstance(src, tuple):
+        return get_zip(src[0]).open(src[1])
+    return open(src, "rb")
+
+def source_path(src):
+    # ffprobe 需要實體檔案, 只有這時才把 ZIP 內的檔案解壓到 TMP_DIR
+    if isinstance(src, tuple):
+        return get_zip(src[0]).extract(src[1], TMP_DIR)
+    return src
+
+def read_sidecar(src):
+    if isinstance(src, tuple):
+        try:
+            return get_zip(src[0]).read(src[1] + ".json")
+        except KeyError:
+            return None
+    jp = src + ".json"
+    if not os.path.exists(jp):
+        return None
+    with open(jp, "rb") as f:
+        return f.read()
+
+def source_mtime(src, stamp=None):
+    # stamp: 掃描時已取得的 ZipInfo.date_time 或 st_mtime, 沒有才重新讀
+    if isinstance(src, tuple):
+        return datetime(*(stamp or get_zip(src[0]).getinfo(src[1]).date_time))
+    return datetime.fromtimestamp(os.path.getmtime(src) if stamp is None else stamp)
+
 # ================= EXIF =================
-def read_exif(path):
+@contextlib.contextmanager
+def mapped(f):
+    # exifread 會做大量小 read/seek, 改用 mmap 直接從 page cache 取
+    if os.fstat(f.fileno()).st_size == 0:
+        yield f
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield mm
+
+def exif_segment(f):
+    # JPEG 的 EXIF 都在 APP1 段: 沿著 marker 往後跳, 只把 SOI + APP1 包成小 buffer 給 exifread
+    # 不是 JPEG, 或在影像資料 (SOS) 前都沒找到 EXIF 時回傳 None, 交給 exifread 讀整個檔案
+    f.seek(0)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA, 0xFF):
+            return None
+        length = int.from_bytes(marker[2:4], "big")
+        if length < 2:
+            return None
+        if marker[1] == 0xE1:
+            body = f.read(length - 2)
+            if body.startswith(b"Exif\x00\x00"):
+                return io.BytesIO(b"\xff\xd8" + marker + body)
+        else:
+            f.seek(length - 2, 1)
+
+class ExifLog(logging.Handler):
+    # exifread 的 warning 依執行緒收集, 不必每個檔案換掉 sys.stderr
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.local = threading.local()
+
+    def emit(self, record):
+        messages = getattr(self.local, "messages", None)
+        if messages is not None:
+            messages.append(record.getMessage())
+
+exif_log = ExifLog()
+logging.getLogger("exifread").addHandler(exif_log)
+logging.getLogger("exifread").propagate = False
+
+def exif_tags(f):
+    messages = exif_log.local.messages = []
+    try:
+        seg = exif_segment(f)
+        tags = exifread.process_file(f if seg is None else seg, details=False, stop_tag=EXIF_STOP_TAG)
+    finally:
+        exif_log.local.messages = None
+    return tags, "\n".join(messages)
+
+def dms_to_decimal(values):
+    # 度/分/秒 (Ratio) -> 十進位度數; num/den 本身就是 int, 直接做真除法
+    d, m, sec = values
+    return d.num / d.den + m.num / m.den / 60 + sec.num / sec.den / 3600
+
+@functools.lru_cache(maxsize=65536)
+def parse_exif_datetime(s):
+    # 連拍的照片 EXIF 時間字串常常一模一樣, 結果快取起來
+    # 標準格式 "YYYY:MM:DD HH:MM:SS" 直接切字串, 其他格式才交給 strptime
+    if (len(s) == 19 and s[4] == s[7] == s[13] == s[16] == ":" and s[10] == " "
+            and (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]).isdigit()):
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                            int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime(s, "%Y:%m:%d %H:%M:%S")
+
+def read_exif(src):
+    path = source_name(src)
     try:
-        with open(path, "rb") as f:
-            stderr = io.StringIO()
-            with contextlib.redirect_stderr(stderr):
-                tags = exifread.process_file(f, details=False)
+        if isinstance(src, tuple):
+            # ZIP 內的檔案直接把串流交給 exifread
+            with open_source(src) as f:
+                tags, err = exif_tags(f)
+        else:
+            with open(src, "rb") as f, mapped(f) as mm:
+                tags, err = exif_tags(mm)
 
-        err = stderr.getvalue()
         if "File format not recognized" in err:
-            file_format_errors.append(path)
+            file_format_errors.add(path)
             return None, None
         if "Possibly corrupted" in err:
-            corrupted_exif_files.append(path)
+            corrupted_exif_files.add(path)
 
         dt = tags.get("EXIF DateTimeOriginal")
-        dt_val = datetime.strptime(str(dt), "%Y:%m:%d %H:%M:%S") if dt else None
+        dt_val = parse_exif_datetime(str(dt)) if dt else None
 
         lat = tags.get("GPS GPSLatitude")
         lon = tags.get("GPS GPSLongitude")
@@ -98,11 +383,8 @@ def read_exif(path):
         lon_ref = tags.get("GPS GPSLongitudeRef")
 
         if lat and lon and lat_ref and lon_ref:
-            def conv(v):
-                d, m, s = [float(x.num) / float(x.den) for x in v.values]
-                return d + m / 60 + s / 3600
-            latitude = conv(lat)
-            longitude = conv(lon)
+            latitude = dms_to_decimal(lat.values)
+            longitude = dms_to_decimal(lon.values)
             if lat_ref.values != "N":
                 latitude = -latitude
             if lon_ref.values != "E":
@@ -111,124 +393,195 @@ def read_exif(path):
 
         return dt_val, None
     except Exception as e:
-        corrupted_exif_files.append(f"{path} | {e}")
+        corrupted_exif_files.add(f"{path} | {e}")
         return None, None
 
 # ================= METADATA.JSON =================
-def read_metadata_json(path):
-    jp = path + ".json"
-    if not os.path.exists(jp):
-        return None, None
+@functools.lru_cache(maxsize=65536)
+def from_timestamp(ts):
+    return datetime.fromtimestamp(ts)
+
+def read_metadata_json(src):
     try:
-        with open(jp, encoding="utf-8") as f:
-            data = json.load(f)
+        raw = read_sidecar(src)
+        if raw is None:
+            return None, None
+        data = json.loads(raw)
         ts = data.get("photoTakenTime", {}).get("timestamp")
         geo = data.get("geoData") or data.get("geoDataExif")
-        dt = datetime.fromtimestamp(int(ts)) if ts else None
+        dt = from_timestamp(int(ts)) if ts else None
         gps = (geo["latitude"], geo["longitude"]) if geo and geo.get("latitude") else None
         return dt, gps
     except Exception as e:
-        corrupted_exif_files.append(f"{jp} | {e}")
+        corrupted_exif_files.add(f"{source_name(src)}.json | {e}")
         return None, None
 
 # ================= VIDEO =================
-def read_video_time(path):
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+def read_mvhd_time(f):
+    # 直接走 MP4/MOV 的 atom 表找 moov/mvhd, 不用為每支影片開 ffprobe
+    # creation_time 是 1904-01-01 (UTC) 起算的秒數
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        offset = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            offset = 16
+        if kind == b"moov":
+            continue  # 往下一層找
+        if kind == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                ts = struct.unpack(">Q", f.read(8))[0]
+            else:
+                ts = struct.unpack(">I", f.read(4))[0]
+            return MP4_EPOCH + timedelta(seconds=ts) if ts else None
+        if size < offset:
+            return None
+        f.seek(size - offset, 1)
+
+def read_video_time(src):
+    try:
+        with open_source(src) as f:
+            dt = read_mvhd_time(f)
+        if dt:
+            return dt
+    except Exception:
+        pass
+
+    # 解析不了才退回 ffprobe
     try:
         r = subprocess.run(
             ["ffprobe", "-v", "quiet",
              "-show_entries", "format_tags=creation_time",
-             "-of", "default=noprint_wrappers=1:nokey=1", path],
+             "-of", "default=noprint_wrappers=1:nokey=1", source_path(src)],
             capture_output=True, text=True
         )
         if r.stdout.strip():
             return datetime.fromisoformat(r.stdout.strip().replace("Z", "+00:00"))
     except:
         pass
-    ffprobe_failed.append(path)
+    # mvhd 和 ffprobe 都讀不到時間才算格式無法辨識
+    ffprobe_failed.add(source_name(src))
+    file_format_errors.add(source_name(src))
     return None
 
 # ================= RESOLVE =================
-def resolve_datetime_and_gps(path):
-    dt, gps = read_exif(path)
-    if dt:
-        return dt, gps
+def resolve_datetime_and_gps(src, mtime=None):
+    path = source_name(src)
+    is_video = os.path.splitext(path)[1].lower() in VIDEO_SET
+    if not is_video:
+        dt, gps = read_exif(src)
+        if dt:
+            return dt, gps
 
-    dt, gps = read_metadata_json(path)
+    dt, gps = read_metadata_json(src)
     if dt:
         return dt, gps
 
-    if path.lower().endswith((".mp4", ".mov")):
-        dt = read_video_time(path)
+    if is_video:
+        dt = read_video_time(src)
         if dt:
             return dt, None
 
     dt = datetime_from_filename(os.path.basename(path))
     if dt:
-        filename_fallback_files.append(path)
+        filename_fallback_files.add(path)
         return dt, None
 
     try:
-        return datetime.fromtimestamp(os.path.getmtime(path)), None
+        return source_mtime(src, mtime), None
     except:
-        unclassified_files.append(path)
+        unclassified_files.add(path)
         return None, None
 
 # ================= OFFLINE GEO =================
-def reverse_geocode_city_offline(lat, lon):
-    # 過濾假 GPS
-    if abs(lat) < 0.001 and abs(lon) < 0.001:
-        reverse_geocode_failed.append(f"{lat},{lon} zero")
-        return None
-
-    key = f"{round(lat,4)},{round(lon,4)}"
-    if key in geo_cache:
-        return tuple(geo_cache[key]) if geo_cache[key] else None
+def get_rg_engine():
+    global rg_engine
+    if rg_engine is None:
+        rg_engine = rg.RGeocoder(mode=1, verbose=False)
+    return rg_engine
+
+def reverse_geocode_batch(points):
+    # points: [(lat, lon), ...] -> [(city, country) 或 None, ...]
+    keys = []
+    missing = {}
+    for lat, lon in points:
+        # 過濾假 GPS
+        if abs(lat) < 0.001 and abs(lon) < 0.001:
+            reverse_geocode_failed.add(f"{lat},{lon} zero")
+            keys.append(None)
+            continue
+        key = f"{round(lat,4)},{round(lon,4)}"
+        keys.append(key)
+        if key not in geo_cache:
+            missing.setdefault(key, (lat, lon))
 
+    if missing:
+        try:
+            # 所有未快取的點一次丟進 KD-tree 查詢
+            results = get_rg_engine().query(list(missing.values()))
+            for key, r in zip(missing, results):
+                city = r.get("name")
+                country = r.get("cc")
+                geo_cache[key] = [city, country] if city and country else None
+        except Exception as e:
+            for key, (lat, lon) in missing.items():
+                reverse_geocode_failed.add(f"{lat},{lon} | {e}")
+                geo_cache[key] = None
+
+    return [tuple(geo_cache[k]) if k and geo_cache[k] else None for k in keys]
+
+# ================= WORKER =================
+def take_worker_logs():
+    logs = tuple(list(lst) for lst in WORKER_LOGS)
+    for lst in WORKER_LOGS:
+        lst.clear()
+    return logs
+
+def merge_worker_logs(logs):
+    for lst, items in zip(WORKER_LOGS, logs):
+        lst.update(items)
+
+def analyze_media(src, mtime=None):
+    # 只讀不寫: EXIF / metadata / ffprobe, 在 worker process 執行
     try:
-        # ⚠️ 一定要用 list 包起來
-        results = rg.search([(lat, lon)], mode=1)
-        if not results:
-            reverse_geocode_failed.append(f"{lat},{lon} no result")
-            geo_cache[key] = None
-            return None
-
-        r = results[0]
-        city = r.get("name")
-        country = r.get("cc")
-
-        place = (city, country) if city and country else None
-        geo_cache[key] = list(place) if place else None
-        return place
-
+        dt, gps = resolve_datetime_and_gps(src, mtime)
     except Exception as e:
-        reverse_geocode_failed.append(f"{lat},{lon} | {e}")
-        geo_cache[key] = None
-        return None
+        corrupted_exif_files.add(f"{source_name(src)} | {e}")
+        dt, gps = None, None
+    return src, dt, gps, take_worker_logs()
 
 # ================= PROCESS =================
-def process_media(path):
-    dt, gps = resolve_datetime_and_gps(path)
+def process_media(src, dt, gps, logs):
+    merge_worker_logs(logs)
     if not dt:
         return
 
     day_dir = os.path.join(TARGET_DIR, str(dt.year), f"{dt.month:02}", f"{dt.day:02}")
-    safe_copy(path, day_dir)
+    safe_copy(src, day_dir)
 
-    if not gps:
-        return
+    if gps:
+        pending_gps.append((gps, dt, day_dir, source_name(src)))
 
-    place = reverse_geocode_city_offline(*gps)
-    if not place:
-        return
+def record_locations():
+    places = reverse_geocode_batch([gps for gps, _, _, _ in pending_gps])
+    for (gps, dt, day_dir, path), place in zip(pending_gps, places):
+        if not place:
+            continue
 
-    city, country = place
-    yearly_locations[dt.year].append(
-            (gps[0], gps[1], city, country, path)
-        )
-    gps_points.append((gps[0], gps[1], dt.strftime("%Y-%m-%d"), place))
-    gps_by_day[day_dir].add(place)
-    year_city_count[dt.year][place] += 1
-    city_total_count[place] += 1
+        city, country = place
+        yearly_locations[dt.year].append(
+                (gps[0], gps[1], city, country, path)
+            )
+        gps_points.append(gps[0], gps[1], dt, place)
+        gps_by_day[day_dir].add(place)
+        year_city_count[dt.year][place] += 1
+        city_total_count[place] += 1
 
 # ================= HTML MAP =================
 def write_html_map():
@@ -285,22 +638,25 @@ def generate_year_map(points, map_path, year):
     m.save(map_path)
 
 # ================= REPORT =================
+def write_lines(path, lines):
+    with open(path, "w", encoding="utf-8", buffering=REPORT_BUF) as f:
+        f.writelines(lines)
+
 def write_reports():
-    with open(os.path.join(TARGET_DIR, "city_ranking.txt"), "w", encoding="utf-8") as f:
-        for i, ((c, ct), cnt) in enumerate(sorted(city_total_count.items(), key=lambda x: -x[1]), 1):
-            f.write(f"{i}. {c}, {ct} : {cnt}\n")
+    ranking = sorted(city_total_count.items(), key=lambda x: -x[1])
+    write_lines(os.path.join(TARGET_DIR, "city_ranking.txt"),
+                (f"{i}. {c}, {ct} : {cnt}\n" for i, ((c, ct), cnt) in enumerate(ranking, 1)))
 
-    with open(os.path.join(TARGET_DIR, "year_location_summary.txt"), "w", encoding="utf-8") as f:
+    with open(os.path.join(TARGET_DIR, "year_location_summary.txt"), "w", encoding="utf-8", buffering=REPORT_BUF) as f:
         for y, cities in sorted(year_city_count.items()):
             f.write(f"{y}\n")
-            for (c, ct), cnt in sorted(cities.items(), key=lambda x: -x[1]):
-                f.write(f"  {c}, {ct} : {cnt}\n")
+            f.writelines(f"  {c}, {ct} : {cnt}\n" for (c, ct), cnt in sorted(cities.items(), key=lambda x: -x[1]))
             f.write("\n")
 
-    with open(os.path.join(TARGET_DIR, "location_summary.txt"), "w", encoding="utf-8") as f:
-        for d, places in sorted(gps_by_day.items()):
-            date = d.replace(TARGET_DIR + os.sep, "").replace(os.sep, "/")
-            f.write(date + " : " + " | ".join(f"{c}, {ct}" for c, ct in places) + "\n")
+    prefix = TARGET_DIR + os.sep
+    write_lines(os.path.join(TARGET_DIR, "location_summary.txt"),
+                (d.replace(prefix, "").replace(os.sep, "/") + " : " + " | ".join(f"{c}, {ct}" for c, ct in places) + "\n"
+                 for d, places in sorted(gps_by_day.items())))
 
     for name, data in [
         ("reverse_geocode_failed.txt", reverse_geocode_failed),
@@ -310,8 +666,8 @@ def write_reports():
         ("used_filename_fallback.txt", filename_fallback_files),
         ("ffprobe_failed.txt", ffprobe_failed),
     ]:
-        with open(os.path.join(TARGET_DIR, name), "w", encoding="utf-8") as f:
-            f.write("\n".join(sorted(set(data))))
+        # 排序後逐行寫出, 不再組一個跟整份清單一樣大的字串
+        write_lines(os.path.join(TARGET_DIR, name), (s + "\n" for s in sorted(data)))
 
 # ================= MAIN =================
 def main():
@@ -321,23 +677,36 @@ def main():
     load_geo_cache()
 
     tasks = []
-    for root, _, files in os.walk(SOURCE_DIR):
-        for f in files:
-            p = os.path.join(root, f)
-            if f.lower().endswith(".zip"):
-                with zipfile.ZipFile(p) as z:
-                    for n in z.namelist():
-                        if n.lower().endswith(MEDIA_EXT):
-                            tasks.append(z.extract(n, TMP_DIR))
-            elif f.lower().endswith(MEDIA_EXT):
-                tasks.append(p)
+    mtimes = []  # 掃描時取得的 ZipInfo.date_time / st_mtime, 給 worker 當最後的日期來源
+    for entry in iter_files(SOURCE_DIR):
+        p = entry.path
+        ext = os.path.splitext(entry.name)[1].lower()
+        if ext == ".zip":
+            # central directory 只掃一次, 依資料在檔案中的位置排序
+            infos = [i for i in get_zip(p).infolist()
+                     if not i.is_dir()
+                     and os.path.splitext(i.filename)[1].lower() in MEDIA_SET]
+            infos.sort(key=lambda i: i.header_offset)
+            tasks.extend((p, i.filename) for i in infos)
+            mtimes.extend(i.date_time for i in infos)
+        elif ext in MEDIA_SET:
+            tasks.append(p)
+            try:
+                mtimes.append(entry.stat().st_mtime)
+            except OSError:
+                mtimes.append(None)  # worker 再用 source_mtime 讀一次
 
     print(f"📦 Total files: {len(tasks)}")
-    for i, p in enumerate(tasks, 1):
-        process_media(p)
-        if i % 100 == 0:
-            print(f"➡️ {i} processed")
-
+    # 讀取 metadata 分散到各核心 (ffprobe 也在 worker 內並行), 複製與統計留在主程序
+    # fork 出來的 worker 不能和主程序共用 ZipFile 的檔案位置, 先各自關掉
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=close_zips) as ex:
+        for i, result in enumerate(ex.map(analyze_media, tasks, mtimes, chunksize=32), 1):
+            process_media(*result)
+            if i % 100 == 0:
+                print(f"➡️ {i} processed")
+    close_zips()
+
+    record_locations()
     save_geo_cache()
     write_reports()
     write_html_map()
@@ -1,15 +1,28 @@
 import os
+import sys
 import zipfile
 import json
 import shutil
+import errno
 import hashlib
+import mmap
+import struct
 import subprocess
 import time
 from collections import defaultdict
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from PIL import Image
 import reverse_geocoder as rg
 import folium
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+try:
+    import orjson  # 有裝就用, 大型 JSON 的讀寫快很多
+except ImportError:
+    orjson = None
 
 # =========================
 # CONFIG
@@ -18,6 +31,8 @@ SOURCE_DIR = r"source"
 TMP_DIR = r"C:\tmp\photo_staging"
 TARGET_DIR = r"final"
 THUMB_DIR = os.path.join(TARGET_DIR, "thumbnails")
+# True: 目的地和來源在同一個磁碟時用 hard link 取代複製 (改動其中一邊另一邊也會變)
+USE_HARDLINK = False
 
 FFMPEG = r"C:\Users\user\Desktop\python\ffmpeg\bin\ffmpeg.exe"
 
@@ -25,10 +40,32 @@ MEDIA_EXT = (
     ".jpg", ".jpeg", ".png", ".mp4", ".mov", ".heic", ".heif",
     ".avi", ".mkv", ".wmv", ".3gp", ".gif", ".tiff", ".webp", ".cr2"
 )
+MEDIA_SET = frozenset(MEDIA_EXT)
 
-HASH_DB = os.path.join(TARGET_DIR, "processed_hashes.txt")
+HASH_CHUNK = 1024 * 1024
+MMAP_HASH_MIN = 4 * 1024 * 1024
+
+# 每筆 32 bytes 的原始 SHA-256 digest 直接串接; 舊版的 hex 文字檔只在第一次讀入轉換
+HASH_DB = os.path.join(TARGET_DIR, "processed_hashes.bin")
+HASH_DB_TXT = os.path.join(TARGET_DIR, "processed_hashes.txt")
+DIGEST_SIZE = 32
 YEAR_POINTS_JSON = os.path.join(TARGET_DIR, "year_points.json")
 UNCLASSIFIED_JSON = os.path.join(TARGET_DIR, "unclassified_points.json")
+STAT_INDEX_JSON = os.path.join(TARGET_DIR, "stat_index.json")
+
+# 已建立過的目的資料夾
+_made_dirs = set()
+# 目的資料夾 -> 裡面已有的檔名 (normcase)
+_dir_names = {}
+
+# 每個 process 各自開著的 ZipFile, 不必每個檔案重讀 central directory
+_zip_handles = {}
+
+# copy_file_range 單次最多複製的位元組數, 以及遇到這些錯誤時改回 shutil.copyfile
+COPY_RANGE_MAX = 1 << 30
+COPY_RANGE_FALLBACK = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.ENOTTY}
+# Linux 的 FICLONE ioctl (reflink); 其他平台沒有
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409) if fcntl and sys.platform.startswith("linux") else None
 
 LOG_DIR = os.path.join(TARGET_DIR, "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -36,65 +73,249 @@ os.makedirs(LOG_DIR, exist_ok=True)
 # =========================
 # GLOBAL STATE (累積)
 # =========================
-processed_hashes = set()
+processed_hashes = set()  # 原始 digest (bytes), 比 64 字元的 hex 字串省一半記憶體
 yearly_locations = defaultdict(list)
 unclassified_locations = []
+thumb_jobs = []  # (來源, 縮圖路徑), 分類完再一起丟進 process pool
+stat_index = {}  # 來源路徑 (ZIP 內為 zip 路徑/成員) -> {"size", "mtime", "sha256"}
+rg_engine = None
 
 # =========================
 # UTIL
 # =========================
 def sha256(path):
-    h = hashlib.sha256()
     with open(path, "rb") as f:
-        for b in iter(lambda: f.read(1024 * 1024), b""):
+        # 大檔直接把整個 mmap 交給 OpenSSL, 不經 Python 逐塊迴圈
+        if os.fstat(f.fileno()).st_size > MMAP_HASH_MIN:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).digest()
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").digest()
+        h = hashlib.sha256()
+        for b in iter(lambda: f.read(HASH_CHUNK), b""):
             h.update(b)
-    return h.hexdigest()
+    return h.digest()
+
+def iter_files(root):
+    # 和 os.walk 一樣先列本層檔案再往下走, 檔案型別直接取自 scandir 的 DirEntry
+    dirs = []
+    try:
+        with os.scandir(root) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.path)
+                elif e.is_file():
+                    yield e
+    except OSError:
+        return
+    for d in dirs:
+        yield from iter_files(d)
 
 def clear_tmp():
     if os.path.exists(TMP_DIR):
         shutil.rmtree(TMP_DIR)
     os.makedirs(TMP_DIR, exist_ok=True)
 
+# 來源是一般檔案路徑, 或 ZIP 內的檔案 (zip_path, member), 直接從 ZIP 串流讀取, 不再先解壓到 TMP_DIR
+def get_zip(zip_path):
+    z = _zip_handles.get(zip_path)
+    if z is None:
+        z = _zip_handles[zip_path] = zipfile.ZipFile(zip_path)
+    return z
+
+def close_zips():
+    for z in _zip_handles.values():
+        z.close()
+    _zip_handles.clear()
+
+def source_name(src):
+    if isinstance(src, tuple):
+        return os.path.join(*src)
+    return src
+
+def open_source(src):
+    if isinstance(src, tuple):
+        return get_zip(src[0]).open(src[1])
+    return open(src, "rb")
+
+def source_path(src):
+    # ffmpeg 需要實體檔案, 只有這時才把 ZIP 內的檔案解壓到 TMP_DIR
+    if isinstance(src, tuple):
+        return get_zip(src[0]).extract(src[1], TMP_DIR)
+    return src
+
+def source_mtime(src, stamp=None):
+    # stamp: 掃描時已取得的 ZipInfo.date_time 或 st_mtime, 沒有才重新讀
+    if isinstance(src, tuple):
+        return datetime(*(stamp or get_zip(src[0]).getinfo(src[1]).date_time))
+    return datetime.fromtimestamp(os.path.getmtime(src) if stamp is None else stamp)
+
+def source_sha256(src):
+    if not isinstance(src, tuple):
+        return sha256(src)
+    h = hashlib.sha256()
+    with open_source(src) as f:
+        for b in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(b)
+    return h.digest()
+
+def zip_members(zip_path):
+    # central directory 只掃一次, 依資料在檔案中的位置排序, 讀取時順著磁碟往後走
+    infos = [i for i in get_zip(zip_path).infolist()
+             if not i.is_dir()
+             and os.path.splitext(i.filename)[1].lower() in MEDIA_SET]
+    infos.sort(key=lambda i: i.header_offset)
+    return infos
+
+def ensure_dir(d):
+    # 建過的目錄記起來, 同一資料夾的後續檔案不用再走 makedirs 的逐層 stat
+    if d not in _made_dirs:
+        os.makedirs(d, exist_ok=True)
+        _made_dirs.add(d)
+
+def fast_copy(src, dst):
+    # 同一個檔案系統又允許的話直接建 hard link, 完全不複製資料 (目的檔和來源共用 mtime)
+    if USE_HARDLINK:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    # 只複製檔案內容再補回 atime/mtime, 省掉 copy2 的 chmod 與額外 stat
+    # Linux 上先試 reflink (btrfs/XFS 的 copy-on-write, 只寫 metadata), 再用 copy_file_range 在 kernel 內複製
+    with open(src, "rb") as fsrc:
+        st = os.fstat(fsrc.fileno())
+        copied = False
+        if FICLONE or hasattr(os, "copy_file_range"):
+            with open(dst, "wb") as fdst:
+                if FICLONE:
+                    try:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+                if not copied and hasattr(os, "copy_file_range"):
+                    try:
+                        while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_RANGE_MAX):
+                            pass
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+    if not copied:
+        shutil.copyfile(src, dst)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+def dir_names(d):
+    # 目的資料夾第一次用到時列一次檔名, 之後檢查同名檔都在記憶體裡比對, 不再逐一 stat
+    # normcase: Windows 的檔名不分大小寫
+    names = _dir_names.get(d)
+    if names is None:
+        ensure_dir(d)
+        names = _dir_names[d] = {os.path.normcase(n) for n in os.listdir(d)}
+    return names
+
 def safe_copy(src, dst):
-    os.makedirs(os.path.dirname(dst), exist_ok=True)
-    if not os.path.exists(dst):
-        shutil.copy2(src, dst)
+    names = dir_names(os.path.dirname(dst))
+    key = os.path.normcase(os.path.basename(dst))
+    if key not in names:
+        names.add(key)
+        if isinstance(src, tuple):
+            with open_source(src) as fsrc, open(dst, "wb") as fdst:
+                shutil.copyfileobj(fsrc, fdst, HASH_CHUNK)
+        else:
+            fast_copy(src, dst)
     return dst
 
 def load_hash_db():
     if os.path.exists(HASH_DB):
-        with open(HASH_DB, "r") as f:
+        with open(HASH_DB, "rb") as f:
+            data = f.read()
+        processed_hashes.update(data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE))
+    elif os.path.exists(HASH_DB_TXT):
+        with open(HASH_DB_TXT, "r") as f:
             for line in f:
-                processed_hashes.add(line.strip())
+                line = line.strip()
+                if line:
+                    processed_hashes.add(bytes.fromhex(line))
 
 def save_hash_db():
-    with open(HASH_DB, "w") as f:
-        for h in sorted(processed_hashes):
-            f.write(h + "\n")
+    with open(HASH_DB, "wb") as f:
+        f.write(b"".join(sorted(processed_hashes)))
+
+def load_json(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def dump_json(obj, path):
+    if orjson:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
 
 def load_year_points():
     if os.path.exists(YEAR_POINTS_JSON):
-        with open(YEAR_POINTS_JSON, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            for y, pts in data.items():
-                yearly_locations[y].extend(pts)
+        for y, pts in load_json(YEAR_POINTS_JSON).items():
+            yearly_locations[y].extend(pts)
 
 def save_year_points():
-    with open(YEAR_POINTS_JSON, "w", encoding="utf-8") as f:
-        json.dump(yearly_locations, f, ensure_ascii=False, indent=2)
+    dump_json(yearly_locations, YEAR_POINTS_JSON)
 
 def load_unclassified():
     if os.path.exists(UNCLASSIFIED_JSON):
-        with open(UNCLASSIFIED_JSON, "r", encoding="utf-8") as f:
-            unclassified_locations.extend(json.load(f))
+        unclassified_locations.extend(load_json(UNCLASSIFIED_JSON))
 
 def save_unclassified():
-    with open(UNCLASSIFIED_JSON, "w", encoding="utf-8") as f:
-        json.dump(unclassified_locations, f, ensure_ascii=False, indent=2)
+    dump_json(unclassified_locations, UNCLASSIFIED_JSON)
+
+def load_stat_index():
+    if os.path.exists(STAT_INDEX_JSON):
+        stat_index.update(load_json(STAT_INDEX_JSON))
+
+def save_stat_index():
+    dump_json(stat_index, STAT_INDEX_JSON)
+
+def fresh_hash(key, size, mtime):
+    # 大小和 mtime 都和上次相同就沿用上次的 sha256, 不用重讀整個檔案
+    prev = stat_index.get(key)
+    if prev and prev["size"] == size and abs(prev["mtime"] - mtime) < 1:
+        return bytes.fromhex(prev["sha256"])
+    return None
 
 # =========================
 # METADATA
 # =========================
+MP4_EPOCH = datetime(1904, 1, 1)
+
+def read_mvhd_time(f):
+    # 直接走 MP4/MOV 的 atom 表找 moov/mvhd, 不用為每支影片開 ffprobe
+    # creation_time 是 1904-01-01 (UTC) 起算的秒數, 和 parse_time 一樣回傳 naive UTC
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        offset = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            offset = 16
+        if kind == b"moov":
+            continue  # 往下一層找
+        if kind == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                ts = struct.unpack(">Q", f.read(8))[0]
+            else:
+                ts = struct.unpack(">I", f.read(4))[0]
+            return MP4_EPOCH + timedelta(seconds=ts) if ts else None
+        if size < offset:
+            return None
+        f.seek(size - offset, 1)
+
 def get_video_time(path):
     try:
         cmd = [
@@ -121,9 +342,16 @@ def parse_time(s):
 # =========================
 # GEO
 # =========================
+def get_rg_engine():
+    # 離線 KD-tree, 第一次查詢時才載入
+    global rg_engine
+    if rg_engine is None:
+        rg_engine = rg.RGeocoder(mode=1, verbose=False)
+    return rg_engine
+
 def reverse_geo(lat, lon):
     try:
-        res = rg.search((lat, lon), mode=1)[0]
+        res = get_rg_engine().query([(lat, lon)])[0]
         return res.get("name"), res.get("cc")
     except:
         return None, None
@@ -150,27 +378,55 @@ def generate_map(points, map_path, title):
 # =========================
 # MAIN PROCESS
 # =========================
-def process_media(path):
-    file_hash = sha256(path)
-    if file_hash in processed_hashes:
-        return
-
-    processed_hashes.add(file_hash)
+def make_thumb(job):
+    # 在子程序產生縮圖; 裝了 Pillow-SIMD (與 Pillow 同 API 的 SSE4/AVX2 版本) 縮放會再快幾倍
+    src, thumb_path = job
+    try:
+        with open_source(src) as f, Image.open(f) as img:
+            # JPEG 解碼時就先縮小 (DCT scaling), 不用解出整張原圖
+            img.draft("RGB", (600, 600))
+            img.thumbnail((300, 300), Image.LANCZOS)
+            img.save(thumb_path, "JPEG")
+    except Exception:
+        pass
 
+def analyze_media(src, file_hash=None, mtime=None):
+    # 只讀不寫: hash + 日期 (含 ffmpeg), 在 worker process 執行
+    if not file_hash:
+        file_hash = source_sha256(src)
     dt = None
-    gps = None
 
-    ext = os.path.splitext(path)[1].lower()
+    ext = os.path.splitext(source_name(src))[1].lower()
 
     if ext in (".mp4", ".mov", ".avi", ".mkv"):
-        dt = parse_time(get_video_time(path))
+        try:
+            with open_source(src) as f:
+                dt = read_mvhd_time(f)
+        except Exception:
+            pass
+        if not dt:
+            dt = parse_time(get_video_time(source_path(src)))
 
     if not dt:
         try:
-            dt = datetime.fromtimestamp(os.path.getmtime(path))
+            dt = source_mtime(src, mtime)
         except:
             pass
 
+    return src, file_hash, dt
+
+def process_media(src, file_hash, dt):
+    # 在主程序依序執行, 去重與複製的順序和單執行緒版本相同
+    if file_hash in processed_hashes:
+        return
+
+    processed_hashes.add(file_hash)
+
+    gps = None
+
+    path = source_name(src)
+    ext = os.path.splitext(path)[1].lower()
+
     if not dt:
         dest_dir = os.path.join(TARGET_DIR, "unclassified")
     else:
@@ -181,16 +437,11 @@ def process_media(path):
             f"{dt.day:02d}"
         )
 
-    dest_path = safe_copy(path, os.path.join(dest_dir, os.path.basename(path)))
+    dest_path = safe_copy(src, os.path.join(dest_dir, os.path.basename(path)))
 
-    thumb_path = os.path.join(THUMB_DIR, file_hash + ".jpg")
+    thumb_path = os.path.join(THUMB_DIR, file_hash.hex() + ".jpg")
     if not os.path.exists(thumb_path) and ext in (".jpg", ".jpeg", ".png"):
-        try:
-            img = Image.open(path)
-            img.thumbnail((300, 300))
-            img.save(thumb_path, "JPEG")
-        except:
-            pass
+        thumb_jobs.append((src, thumb_path))
 
     if gps and dt:
         city, country = reverse_geo(*gps)
@@ -221,26 +472,55 @@ def main():
     load_hash_db()
     load_year_points()
     load_unclassified()
-
-    for root, _, files in os.walk(SOURCE_DIR):
-        for name in files:
-            src = os.path.join(root, name)
-            ext = os.path.splitext(name)[1].lower()
-
-            if ext == ".zip":
-                with zipfile.ZipFile(src) as z:
-                    z.extractall(TMP_DIR)
-            elif ext in MEDIA_EXT:
-                shutil.copy2(src, TMP_DIR)
-
-    for root, _, files in os.walk(TMP_DIR):
-        for name in files:
-            if os.path.splitext(name)[1].lower() in MEDIA_EXT:
-                process_media(os.path.join(root, name))
+    load_stat_index()
+
+    tasks = []
+    known = []
+    mtimes = []  # 掃描時取得的 ZipInfo.date_time / st_mtime, 給 worker 當最後的日期來源
+    stats = []  # (來源 key, size, mtime)
+    for entry in iter_files(SOURCE_DIR):
+        src = entry.path
+        ext = os.path.splitext(entry.name)[1].lower()
+
+        if ext == ".zip":
+            for i in zip_members(src):
+                key = os.path.join(src, i.filename)
+                mtime = time.mktime(i.date_time + (0, 0, -1))
+                h = fresh_hash(key, i.file_size, mtime)
+                # 上次跑過且內容沒變的檔案直接跳過
+                if h in processed_hashes:
+                    continue
+                tasks.append((src, i.filename))
+                known.append(h)
+                mtimes.append(i.date_time)
+                stats.append((key, i.file_size, mtime))
+        elif ext in MEDIA_SET:
+            st = entry.stat()
+            h = fresh_hash(src, st.st_size, st.st_mtime)
+            if h in processed_hashes:
+                continue
+            tasks.append(src)
+            known.append(h)
+            mtimes.append(st.st_mtime)
+            stats.append((src, st.st_size, st.st_mtime))
+
+    # fork 出來的 worker 不能和主程序共用 ZipFile 的檔案位置, 先各自關掉
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=close_zips) as ex:
+        results = ex.map(analyze_media, tasks, known, mtimes, chunksize=32)
+        for (src, file_hash, dt), (key, size, mtime) in zip(results, stats):
+            process_media(src, file_hash, dt)
+            stat_index[key] = {"size": size, "mtime": mtime, "sha256": file_hash.hex()}
+    close_zips()
+
+    if thumb_jobs:
+        ensure_dir(THUMB_DIR)
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=close_zips) as ex:
+            list(ex.map(make_thumb, thumb_jobs, chunksize=16))
 
     save_hash_db()
     save_year_points()
     save_unclassified()
+    save_stat_index()
 
     for year, pts in yearly_locations.items():
         year_dir = os.path.join(TARGET_DIR, year)
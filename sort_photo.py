@@ -1,22 +1,51 @@
 import os
+import sys
 import zipfile
 import json
 import shutil
+import errno
 import hashlib
+import mmap
 import re
 import io
 import contextlib
+import logging
+import threading
+import functools
+import tempfile
+import sqlite3
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import exifread
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+try:
+    import orjson  # 有裝就用, 大型 JSON 的讀寫快很多
+except ImportError:
+    orjson = None
+try:
+    import blake3  # 有裝就用 BLAKE3 (SIMD + 多執行緒), 比 SHA-256 快數倍
+except ImportError:
+    blake3 = None
 
 # ====== PATH SETTING ======
 SOURCE_DIR = "source"
 TARGET_DIR = "photo"
-TMP_DIR = "/tmp/takeout_tmp"
 UNCLASSIFIED_DIR = os.path.join(TARGET_DIR, "unclassified")
+# True: 目的地和來源在同一個磁碟時用 hard link 取代複製 (改動其中一邊另一邊也會變)
+USE_HARDLINK = False
 
 # ====== OUTPUT FILES ======
-HASH_DB = os.path.join(TARGET_DIR, "hash_index.json")
+# SQLite: hash -> 目的路徑, 以及每個已複製檔案的大小, 新的紀錄邊處理邊寫入
+# 舊版的 ndjson / json 索引只在第一次讀入轉換
+HASH_DB = os.path.join(TARGET_DIR, "hash_index.db")
+HASH_DB_NDJSON = os.path.join(TARGET_DIR, "hash_index.ndjson")
+HASH_DB_JSON = os.path.join(TARGET_DIR, "hash_index.json")
+SIZE_DB = os.path.join(TARGET_DIR, "size_index.json")
+STAT_DB = os.path.join(TARGET_DIR, "stat_index.json")
 DUP_FILE = os.path.join(TARGET_DIR, "duplicate_files.txt")
 UNCLASS_FILE = os.path.join(TARGET_DIR, "unclassified_files.txt")
 FMT_ERR_FILE = os.path.join(TARGET_DIR, "file_format_not_recognized.txt")
@@ -24,170 +53,782 @@ CORRUPT_FILE = os.path.join(TARGET_DIR, "corrupted_exif_files.txt")
 FILENAME_FALLBACK_FILE = os.path.join(TARGET_DIR, "used_filename_fallback.txt")
 
 # ====== MEMORY ======
-hash_index = {}
-duplicate_files = []
-unclassified_files = []
-file_format_errors = []
-corrupted_exif_files = []
-filename_fallback_files = []
-
-MEDIA_EXT = (".jpg", ".jpeg", ".png", ".mp4", ".mov")
+hash_db = None  # HASH_DB 的連線, 只有主程序使用
+size_index = {}  # str(檔案大小) -> [已複製的目的路徑], 大小沒撞過的檔案不用算 hash (HASH_DB 的 s 表)
+# "來源|大小|mtime" -> hash; 沒算 hash 就複製的檔案記成 "@目的路徑"
+stat_index = {}
+duplicate_files = set()
+unclassified_files = set()
+file_format_errors = set()
+corrupted_exif_files = set()
+filename_fallback_files = set()
+
+# worker process 內寫入的 log, 每個檔案分析完後取回交給主程序合併
+WORKER_LOGS = (file_format_errors, corrupted_exif_files, filename_fallback_files)
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png")
+# exifread 不支援的影片格式, 改讀 mvhd atom
+VIDEO_EXT = (".mp4", ".mov")
+MEDIA_EXT = IMAGE_EXT + VIDEO_EXT
+MEDIA_SET = frozenset(MEDIA_EXT)
+VIDEO_SET = frozenset(VIDEO_EXT)
+
+PNG_SIG = b"\x89PNG\r\n\x1a\n"
+# MP4/MOV 的時間是 1904-01-01 (UTC) 起算的秒數, 減掉這個差距就是 Unix timestamp
+MP4_EPOCH_OFFSET = 2082844800
+
+HASH_CHUNK = 1024 * 1024
+# 目前使用的 hash; BLAKE3 的 key 加上 "b3:" 前綴, 和舊的 SHA-256 key 不會混淆
+HASH_ALGO = "sha256"
+MMAP_HASH_MIN = 4 * 1024 * 1024
+REPORT_BUF = 1024 * 1024
+SPOOL_MAX = 16 * 1024 * 1024
+# exifread 讀到這個 tag 就停止掃描所在的 IFD (比對的是不含 IFD 前綴的名稱)
+EXIF_STOP_TAG = "DateTimeOriginal"
+
+# 每個 process 各自開著的 ZipFile, 不必每個檔案重讀 central directory
+_zip_handles = {}
+
+# 檔名中的日期: 20230105 / 2023-01-05 / 2023_01_05 (含 20230105_123456)
+DATE_RE = re.compile(r"(20\d{2})[-_]?(\d{2})[-_]?(\d{2})")
+
+# (dest_dir, 檔名) -> safe_copy 下一個要試的編號
+_next_suffix = {}
+
+# safe_copy 已建立過的目的資料夾
+_made_dirs = set()
+# 目的資料夾 -> 裡面已有的檔名 (normcase)
+_dir_names = {}
+
+# copy_file_range 單次最多複製的位元組數, 以及遇到這些錯誤時改回 shutil.copyfile
+COPY_RANGE_MAX = 1 << 30
+COPY_RANGE_FALLBACK = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.ENOTTY}
+# Linux 的 FICLONE ioctl (reflink); 其他平台沒有
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409) if fcntl and sys.platform.startswith("linux") else None
 
 
 # ====== UTIL ======
+def pick_hash_algo():
+    # 舊索引裡已有 SHA-256 key 就繼續用 SHA-256, 否則同一張照片會因演算法不同而去重失敗
+    sha = hash_db.execute("SELECT 1 FROM h WHERE hash NOT LIKE 'b3:%' LIMIT 1").fetchone()
+    if blake3 and not sha:
+        return "blake3"
+    return "sha256"
+
+
+def new_hasher():
+    return blake3.blake3() if HASH_ALGO == "blake3" else hashlib.sha256()
+
+
+def hash_key(h):
+    return "b3:" + h.hexdigest() if HASH_ALGO == "blake3" else h.hexdigest()
+
+
+def hash_buffer(buf):
+    h = new_hasher()
+    h.update(buf)
+    return hash_key(h)
+
+
 def file_hash(path):
-    h = hashlib.sha256()
+    if HASH_ALGO == "blake3":
+        h = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        h.update_mmap(path)
+        return hash_key(h)
     with open(path, "rb") as f:
-        for c in iter(lambda: f.read(8192), b""):
+        # 大檔直接把整個 mmap 交給 OpenSSL, 不經 Python 逐塊迴圈
+        if os.fstat(f.fileno()).st_size > MMAP_HASH_MIN:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).hexdigest()
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        for c in iter(lambda: f.read(HASH_CHUNK), b""):
             h.update(c)
     return h.hexdigest()
 
 
+def load_json(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def open_hash_db():
+    db = sqlite3.connect(HASH_DB, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS h (hash TEXT PRIMARY KEY, dest TEXT)")
+    db.execute("CREATE INDEX IF NOT EXISTS h_dest ON h (dest)")
+    # 沒算 hash 就複製的檔案也要記下大小, 中斷後重跑才知道要和誰比對
+    db.execute("CREATE TABLE IF NOT EXISTS s (dest TEXT PRIMARY KEY, size INTEGER)")
+    if db.execute("SELECT 1 FROM h LIMIT 1").fetchone() is None:
+        old = list(read_old_hash_index())
+        if old:
+            with db:
+                db.execute("BEGIN")
+                db.executemany("INSERT OR IGNORE INTO h VALUES (?, ?)", old)
+    return db
+
+
+def read_old_hash_index():
+    if os.path.exists(HASH_DB_NDJSON):
+        with open(HASH_DB_NDJSON, "rb") as f:
+            for line in f:
+                try:
+                    d = orjson.loads(line) if orjson else json.loads(line)
+                except ValueError:
+                    continue  # 中斷時寫到一半的行
+                yield d["h"], d["p"]
+    elif os.path.exists(HASH_DB_JSON):
+        yield from load_json(HASH_DB_JSON).items()
+
+
+def hash_dest(h):
+    row = hash_db.execute("SELECT dest FROM h WHERE hash = ?", (h,)).fetchone()
+    return row[0] if row else None
+
+
+def add_hash(h, dest):
+    # autocommit: 每筆新紀錄立刻寫進 WAL, 程式中途停掉也不會丟掉已複製檔案的索引
+    hash_db.execute("INSERT OR IGNORE INTO h VALUES (?, ?)", (h, dest))
+
+
+def add_size(size, dest):
+    size_index.setdefault(str(size), []).append(dest)
+    hash_db.execute("INSERT OR IGNORE INTO s VALUES (?, ?)", (dest, size))
+
+
+def dump_json(obj, path):
+    if orjson:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+
+
+def ensure_dir(d):
+    # 建過的目錄記起來, 同一資料夾的後續檔案不用再走 makedirs 的逐層 stat
+    if d not in _made_dirs:
+        os.makedirs(d, exist_ok=True)
+        _made_dirs.add(d)
+
+
+def fast_copy(src, dst):
+    # 同一個檔案系統又允許的話直接建 hard link, 完全不複製資料 (目的檔和來源共用 mtime)
+    if USE_HARDLINK:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    # 只複製檔案內容再補回 atime/mtime, 省掉 copy2 的 chmod 與額外 stat
+    # Linux 上先試 reflink (btrfs/XFS 的 copy-on-write, 只寫 metadata), 再用 copy_file_range 在 kernel 內複製
+    with open(src, "rb") as fsrc:
+        st = os.fstat(fsrc.fileno())
+        copied = False
+        if FICLONE or hasattr(os, "copy_file_range"):
+            with open(dst, "wb") as fdst:
+                if FICLONE:
+                    try:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+                if not copied and hasattr(os, "copy_file_range"):
+                    try:
+                        while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_RANGE_MAX):
+                            pass
+                        copied = True
+                    except OSError as e:
+                        if e.errno not in COPY_RANGE_FALLBACK:
+                            raise
+    if not copied:
+        shutil.copyfile(src, dst)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def dir_names(d):
+    # 目的資料夾第一次用到時列一次檔名, 之後檢查同名檔都在記憶體裡比對, 不再逐一 stat
+    # normcase: Windows 的檔名不分大小寫
+    names = _dir_names.get(d)
+    if names is None:
+        ensure_dir(d)
+        names = _dir_names[d] = {os.path.normcase(n) for n in os.listdir(d)}
+    return names
+
+
 def safe_copy(src, dest_dir):
-    os.makedirs(dest_dir, exist_ok=True)
-    base = os.path.basename(src)
+    names = dir_names(dest_dir)
+    base = os.path.basename(source_name(src))
     name, ext = os.path.splitext(base)
-    dest = os.path.join(dest_dir, base)
-    i = 1
-    while os.path.exists(dest):
-        dest = os.path.join(dest_dir, f"{name}_{i}{ext}")
+    # 從上次用到的編號接著試, 同名檔案很多時不用每次從 _1 開始 stat
+    key = (dest_dir, base)
+    i = _next_suffix.get(key, 0)
+    cand = f"{name}_{i}{ext}" if i else base
+    while os.path.normcase(cand) in names:
         i += 1
-    shutil.copy2(src, dest)
+        cand = f"{name}_{i}{ext}"
+    _next_suffix[key] = i + 1
+    names.add(os.path.normcase(cand))
+    dest = os.path.join(dest_dir, cand)
+    if isinstance(src, tuple):
+        with open_source(src) as fsrc, open(dest, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, HASH_CHUNK)
+    else:
+        fast_copy(src, dest)
     return dest
 
 
+def iter_files(root):
+    # 和 os.walk 一樣先列本層檔案再往下走, 檔案型別直接取自 scandir 的 DirEntry
+    dirs = []
+    try:
+        with os.scandir(root) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.path)
+                elif e.is_file():
+                    yield e
+    except OSError:
+        return
+    for d in dirs:
+        yield from iter_files(d)
+
+
+# ====== SOURCE ======
+# 來源是一般檔案路徑, 或 ZIP 內的檔案 (zip_path, member), 不再解壓到暫存目錄
+def get_zip(zip_path):
+    z = _zip_handles.get(zip_path)
+    if z is None:
+        z = _zip_handles[zip_path] = zipfile.ZipFile(zip_path, "r")
+    return z
+
+
+def close_zips():
+    for z in _zip_handles.values():
+        z.close()
+    _zip_handles.clear()
+
+
+def init_worker(algo):
+    # spawn 啟動的 worker 不會繼承主程序的全域變數, hash 演算法要明確傳進來
+    global HASH_ALGO
+    HASH_ALGO = algo
+    close_zips()
+
+
+def source_name(src):
+    if isinstance(src, tuple):
+        return os.path.join(*src)
+    return src
+
+
+def open_source(src):
+    if isinstance(src, tuple):
+        return get_zip(src[0]).open(src[1])
+    return open(src, "rb")
+
+
+def read_sidecar(src, jp=None):
+    # jp: 掃描來源時找到的 sidecar 路徑, "" 表示這個檔案沒有 sidecar; None 才自己檢查
+    if isinstance(src, tuple):
+        try:
+            return get_zip(src[0]).read(src[1] + ".json")
+        except KeyError:
+            return None
+    if jp is None:
+        jp = src + ".json"
+        if not os.path.exists(jp):
+            return None
+    elif not jp:
+        return None
+    with open(jp, "rb") as f:
+        return f.read()
+
+
+def source_mtime(src, stamp=None):
+    # stamp: 掃描時已取得的 ZipInfo.date_time 或 st_mtime, 沒有才重新讀
+    if isinstance(src, tuple):
+        return datetime(*(stamp or get_zip(src[0]).getinfo(src[1]).date_time))
+    return datetime.fromtimestamp(os.path.getmtime(src) if stamp is None else stamp)
+
+
+def spool_member(src):
+    # ZIP 內的檔案只解壓一次: 邊讀邊 hash, 內容留在 spool 給 EXIF 用
+    h = new_hasher()
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    with open_source(src) as f:
+        for c in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(c)
+            buf.write(c)
+    buf.seek(0)
+    return hash_key(h), buf
+
+
 # ====== DATE FROM FILENAME ======
 def datetime_from_filename(filename):
-    patterns = [
-        r"(20\d{2})(\d{2})(\d{2})",
-        r"(20\d{2})[-_](\d{2})[-_](\d{2})",
-        r"(20\d{2})(\d{2})(\d{2})[_-]\d{6}",
-    ]
-    for p in patterns:
-        m = re.search(p, filename)
-        if m:
-            try:
-                y, mo, d = map(int, m.groups()[:3])
-                return datetime(y, mo, d)
-            except ValueError:
-                pass
+    # 第一個候選不是合法日期 (例如流水號) 時, 繼續試後面的位置
+    for m in DATE_RE.finditer(filename):
+        try:
+            y, mo, d = map(int, m.groups())
+            return datetime(y, mo, d)
+        except ValueError:
+            pass
     return None
 
 
 # ====== EXIF ======
-def read_exif(path):
+@contextlib.contextmanager
+def mapped(f):
+    # exifread 會做大量小 read/seek, 改用 mmap 直接從 page cache 取
+    if os.fstat(f.fileno()).st_size == 0:
+        yield f
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield mm
+
+
+def exif_segment(f):
+    # JPEG 的 EXIF 都在 APP1 段: 沿著 marker 往後跳, 只把 SOI + APP1 包成小 buffer 給 exifread
+    # 不是 JPEG, 或在影像資料 (SOS) 前都沒找到 EXIF 時回傳 None, 交給 exifread 讀整個檔案
+    f.seek(0)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA, 0xFF):
+            return None
+        length = int.from_bytes(marker[2:4], "big")
+        if length < 2:
+            return None
+        if marker[1] == 0xE1:
+            body = f.read(length - 2)
+            if body.startswith(b"Exif\x00\x00"):
+                return io.BytesIO(b"\xff\xd8" + marker + body)
+        else:
+            f.seek(length - 2, 1)
+
+
+class ExifLog(logging.Handler):
+    # exifread 的 warning 依執行緒收集, 不必每個檔案換掉 sys.stderr
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.local = threading.local()
+
+    def emit(self, record):
+        messages = getattr(self.local, "messages", None)
+        if messages is not None:
+            messages.append(record.getMessage())
+
+
+exif_log = ExifLog()
+logging.getLogger("exifread").addHandler(exif_log)
+logging.getLogger("exifread").propagate = False
+
+
+def exif_tags(f):
+    messages = exif_log.local.messages = []
     try:
-        with open(path, "rb") as f:
-            stderr = io.StringIO()
-            with contextlib.redirect_stderr(stderr):
-                tags = exifread.process_file(f, details=False)
+        seg = exif_segment(f)
+        tags = exifread.process_file(f if seg is None else seg, details=False, stop_tag=EXIF_STOP_TAG)
+    finally:
+        exif_log.local.messages = None
+    return tags, "\n".join(messages)
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_exif_datetime(s):
+    # 連拍的照片 EXIF 時間字串常常一模一樣, 結果快取起來
+    # 標準格式 "YYYY:MM:DD HH:MM:SS" 直接切字串, 其他格式才交給 strptime
+    if (len(s) == 19 and s[4] == s[7] == s[13] == s[16] == ":" and s[10] == " "
+            and (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]).isdigit()):
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                            int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime(s, "%Y:%m:%d %H:%M:%S")
+
+
+def png_chunks(f):
+    # 依序產生 (chunk 類型, 資料長度); 呼叫端可以讀資料, 沒讀完的部分在下一輪跳過
+    f.seek(0)
+    if f.read(8) != PNG_SIG:
+        return
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        if kind == b"IEND":
+            return
+        start = f.tell()
+        yield kind, size
+        try:
+            f.seek(start + size + 4)  # 資料 + CRC
+        except ValueError:
+            return  # mmap 不能 seek 超過檔尾: 檔案被截斷
+
+
+def read_png_exif(f):
+    # PNG 的 EXIF 在 eXIf chunk (裸的 TIFF), 直接取出交給 exifread
+    for kind, size in png_chunks(f):
+        if kind == b"eXIf":
+            tags, _ = exif_tags(io.BytesIO(f.read(size)))
+            dt = tags.get("EXIF DateTimeOriginal")
+            return parse_exif_datetime(str(dt)) if dt else None
+    return None
+
+
+def read_png_text_time(path, f=None):
+    # tEXt 的 "Creation Time", 其次 tIME (最後修改時間); 不如 sidecar 可靠, 只在沒有 sidecar 時使用
+    try:
+        if f is None:
+            with open(path, "rb") as f, mapped(f) as mm:
+                return read_png_text_time(path, mm)
+
+        modified = None
+        for kind, size in png_chunks(f):
+            if kind == b"tEXt":
+                key, _, value = f.read(size).partition(b"\x00")
+                if key == b"Creation Time":
+                    try:
+                        return parse_exif_datetime(value.decode("latin-1").strip())
+                    except ValueError:
+                        pass
+            elif kind == b"tIME" and size == 7 and modified is None:
+                try:
+                    modified = datetime(*struct.unpack(">HBBBBB", f.read(7)))
+                except ValueError:
+                    pass
+        return modified
+    except Exception as e:
+        corrupted_exif_files.add(f"{path} | {e}")
+        return None
+
+
+def read_exif(path, f=None):
+    try:
+        if f is None:
+            with open(path, "rb") as f, mapped(f) as mm:
+                return read_exif(path, mm)
+
+        if path.lower().endswith(".png"):
+            return read_png_exif(f)
+
+        tags, err = exif_tags(f)
 
-        err = stderr.getvalue()
         if "File format not recognized" in err:
-            file_format_errors.append(path)
+            file_format_errors.add(path)
             return None
 
         if "Possibly corrupted" in err:
-            corrupted_exif_files.append(path)
+            corrupted_exif_files.add(path)
 
         dt = tags.get("EXIF DateTimeOriginal")
-        return datetime.strptime(str(dt), "%Y:%m:%d %H:%M:%S") if dt else None
+        return parse_exif_datetime(str(dt)) if dt else None
     except Exception as e:
-        corrupted_exif_files.append(f"{path} | {e}")
+        corrupted_exif_files.add(f"{path} | {e}")
         return None
 
 
-# ====== METADATA.JSON ======
-def read_metadata_json(path):
-    jp = path + ".json"
-    if not os.path.exists(jp):
+# ====== VIDEO ======
+def read_mvhd_time(f):
+    # 沿著 atom 表跳到 moov/mvhd, creation_time 是 1904 年起算的秒數 (UTC)
+    f.seek(0)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack(">I4s", header)
+        offset = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            offset = 16
+        if kind == b"moov":
+            continue  # 往下一層找
+        if kind == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                ts = struct.unpack(">Q", f.read(8))[0]
+            else:
+                ts = struct.unpack(">I", f.read(4))[0]
+            # 轉成本地時間, 和 EXIF / sidecar / mtime 一致
+            return datetime.fromtimestamp(ts - MP4_EPOCH_OFFSET) if ts else None
+        if size < offset:
+            return None
+        try:
+            f.seek(size - offset, 1)
+        except ValueError:
+            return None  # mmap 不能 seek 超過檔尾: 被截斷或不是 MP4 的檔案
+
+
+def read_video_time(path, f=None):
+    try:
+        if f is None:
+            with open(path, "rb") as f, mapped(f) as mm:
+                return read_video_time(path, mm)
+
+        dt = read_mvhd_time(f)
+        if dt is None:
+            file_format_errors.add(path)
+        return dt
+    except Exception as e:
+        corrupted_exif_files.add(f"{path} | {e}")
         return None
+
+
+# ====== METADATA.JSON ======
+@functools.lru_cache(maxsize=65536)
+def from_timestamp(ts):
+    return datetime.fromtimestamp(ts)
+
+
+def read_metadata_json(src, sidecar=None):
     try:
-        with open(jp, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        raw = read_sidecar(src, sidecar)
+        if raw is None:
+            return None
+        data = orjson.loads(raw) if orjson else json.loads(raw)
         ts = data.get("photoTakenTime", {}).get("timestamp")
-        return datetime.fromtimestamp(int(ts)) if ts else None
+        return from_timestamp(int(ts)) if ts else None
     except Exception as e:
-        corrupted_exif_files.append(f"{jp} | {e}")
+        corrupted_exif_files.add(f"{source_name(src)}.json | {e}")
         return None
 
 
 # ====== DATE RESOLVER ======
-def resolve_datetime(path):
-    dt = read_exif(path)
-    if dt:
-        return dt
-
-    dt = read_metadata_json(path)
-    if dt:
-        return dt
+def resolve_datetime(src, f=None, mtime=None, sidecar=None):
+    path = source_name(src)
+    if os.path.splitext(path)[1].lower() in VIDEO_SET:
+        # 影片先看 sidecar, 沒有才去讀 mvhd
+        dt = read_metadata_json(src, sidecar) or read_video_time(path, f)
+        if dt:
+            return dt
+    else:
+        dt = read_exif(path, f) or read_metadata_json(src, sidecar)
+        if not dt and path.lower().endswith(".png"):
+            dt = read_png_text_time(path, f)
+        if dt:
+            return dt
 
     dt = datetime_from_filename(os.path.basename(path))
     if dt:
-        filename_fallback_files.append(path)
+        filename_fallback_files.add(path)
         return dt
 
     try:
-        return datetime.fromtimestamp(os.path.getmtime(path))
+        return source_mtime(src, mtime)
     except Exception:
         return None
 
 
+# ====== WORKER ======
+def take_worker_logs():
+    logs = tuple(list(lst) for lst in WORKER_LOGS)
+    for lst in WORKER_LOGS:
+        lst.clear()
+    return logs
+
+
+def merge_worker_logs(logs):
+    for lst, items in zip(WORKER_LOGS, logs):
+        lst.update(items)
+
+
+def analyze_media(src, need_hash=True, known=None, mtime=None, sidecar=None):
+    # 只讀不寫: hash + 日期, 在 worker process 執行
+    # 大小獨一無二的檔案不可能重複, 不算 hash, 以 "" 表示; 上次算過的 hash 直接沿用
+    try:
+        if isinstance(src, tuple):
+            if known or not need_hash:
+                h, f = known or "", open_source(src)
+            else:
+                h, f = spool_member(src)
+            with f:
+                dt = resolve_datetime(src, f, mtime, sidecar)
+        elif need_hash and not known:
+            # 同一個 mmap 先算 hash 再交給 exifread, 檔案只開一次、只讀一遍
+            with open(src, "rb") as f, mapped(f) as mm:
+                h = hash_buffer(b"" if mm is f else mm)
+                dt = resolve_datetime(src, mm, mtime, sidecar)
+        else:
+            h = known or ""
+            dt = resolve_datetime(src, mtime=mtime, sidecar=sidecar)
+    except Exception as e:
+        corrupted_exif_files.add(f"{source_name(src)} | UNKNOWN | {e}")
+        h = dt = None
+    return src, h, dt, take_worker_logs()
+
+
 # ====== PROCESS MEDIA ======
-def process_media(path):
-    h = file_hash(path)
-    if h in hash_index:
-        duplicate_files.append(f"{path} -> {hash_index[h]}")
-        return
+def process_media(src, h, dt, logs, size):
+    # 在主程序依序執行, 去重與複製的順序和單執行緒版本相同
+    path = source_name(src)
+    prev = hash_dest(h) if h else None
+    if prev:
+        duplicate_files.add(f"{path} -> {prev}")
+        return None
 
-    dt = resolve_datetime(path)
-    if not dt:
-        unclassified_files.append(path)
-        dest = safe_copy(path, UNCLASSIFIED_DIR)
-        hash_index[h] = dest
-        return
+    merge_worker_logs(logs)
+    if h is None:
+        return None
 
-    folder = os.path.join(
-        TARGET_DIR, str(dt.year), f"{dt.month:02}", f"{dt.day:02}"
-    )
-    dest = safe_copy(path, folder)
-    hash_index[h] = dest
+    if not dt:
+        unclassified_files.add(path)
+        dest = safe_copy(src, UNCLASSIFIED_DIR)
+    else:
+        folder = os.path.join(
+            TARGET_DIR, str(dt.year), f"{dt.month:02}", f"{dt.day:02}"
+        )
+        dest = safe_copy(src, folder)
+    if h:
+        add_hash(h, dest)
+    add_size(size, dest)
+    return dest
 
 
-def process_zip(zip_path):
-    with zipfile.ZipFile(zip_path, "r") as z:
-        for name in z.namelist():
-            if name.lower().endswith(MEDIA_EXT):
-                extracted = z.extract(name, TMP_DIR)
-                process_media(extracted)
+def promote_hash(dest):
+    # 之前沒算 hash 的檔案遇到同樣大小的新檔案, 改用已複製的那份補算
+    try:
+        return dest, file_hash(dest)
+    except OSError:
+        return dest, None
+
+
+def stat_key(*parts):
+    return "|".join(str(p) for p in parts)
+
+
+def load_size_index():
+    if hash_db.execute("SELECT 1 FROM s LIMIT 1").fetchone() is None:
+        # 舊版的 size_index.json, 或更早只有 hash_index 時從已複製的檔案補建一次
+        if os.path.exists(SIZE_DB):
+            old = [(dest, int(size)) for size, dests in load_json(SIZE_DB).items() for dest in dests]
+        else:
+            old = []
+            for (dest,) in hash_db.execute("SELECT dest FROM h").fetchall():
+                try:
+                    old.append((dest, os.path.getsize(dest)))
+                except OSError:
+                    pass
+        if old:
+            with hash_db:
+                hash_db.execute("BEGIN")
+                hash_db.executemany("INSERT OR IGNORE INTO s VALUES (?, ?)", old)
+    for dest, size in hash_db.execute("SELECT dest, size FROM s"):
+        size_index.setdefault(str(size), []).append(dest)
+
+
+def zip_members(zip_path):
+    # central directory 只掃一次, 依資料在檔案中的位置排序, 讀取時順著磁碟往後走
+    infos = [i for i in get_zip(zip_path).infolist()
+             if not i.is_dir()
+             and os.path.splitext(i.filename)[1].lower() in MEDIA_SET]
+    infos.sort(key=lambda i: i.header_offset)
+    return [((zip_path, i.filename), i) for i in infos]
 
 
 # ====== MAIN ======
 def main():
+    global HASH_ALGO, hash_db
     os.makedirs(TARGET_DIR, exist_ok=True)
-    os.makedirs(TMP_DIR, exist_ok=True)
-
-    if os.path.exists(HASH_DB):
-        with open(HASH_DB, "r", encoding="utf-8") as f:
-            hash_index.update(json.load(f))
 
-    for root, _, files in os.walk(SOURCE_DIR):
-        for f in files:
-            path = os.path.join(root, f)
+    hash_db = open_hash_db()
+    HASH_ALGO = pick_hash_algo()
+    load_size_index()
+    if os.path.exists(STAT_DB):
+        stat_index.update(load_json(STAT_DB))
+
+    found = []
+    # 掃描時順便記下 sidecar: normcase(媒體路徑) -> sidecar 路徑, worker 不必再逐一檢查檔案是否存在
+    sidecars = {}
+    for entry in iter_files(SOURCE_DIR):
+        path = entry.path
+        ext = os.path.splitext(entry.name)[1].lower()
+        try:
+            if ext == ".zip":
+                zip_abs = os.path.abspath(path)
+                for src, info in zip_members(path):
+                    found.append((src, info.file_size, stat_key(
+                        zip_abs, info.filename, info.file_size, "%04d%02d%02d%02d%02d%02d" % info.date_time),
+                        info.date_time))
+            elif ext in MEDIA_SET:
+                # scandir 已經 stat 過, mtime 一併交給 worker 當最後的日期來源 (到 worker 才轉成 datetime)
+                st = entry.stat()
+                found.append((path, st.st_size, stat_key(os.path.abspath(path), st.st_size, st.st_mtime_ns),
+                              st.st_mtime))
+            elif ext == ".json":
+                sidecars[os.path.normcase(path[:-5])] = path
+        except Exception as e:
+            corrupted_exif_files.add(f"{path} | UNKNOWN | {e}")
+
+    # 來源沒變動: 已知是重複的直接記下, 不用再讀檔; 其他的沿用上次的 hash
+    tasks = []
+    sizes = []
+    keys = []
+    known = []
+    mtimes = []
+    sidecar_paths = []
+    b3 = HASH_ALGO == "blake3"
+    for src, size, key, mtime in found:
+        prev = stat_index.get(key)
+        if prev and prev.startswith("@"):
+            duplicate_files.add(f"{source_name(src)} -> {prev[1:]}")
+            continue
+        dest = hash_dest(prev) if prev else None
+        if dest:
+            duplicate_files.add(f"{source_name(src)} -> {dest}")
+            continue
+        tasks.append(src)
+        sizes.append(size)
+        keys.append(key)
+        # 換過 hash 演算法的舊紀錄不能沿用
+        known.append(prev if prev and prev.startswith("b3:") == b3 else None)
+        mtimes.append(mtime)
+        sidecar_paths.append(None if isinstance(src, tuple) else sidecars.get(os.path.normcase(src), ""))
+
+    # 只有大小和別的檔案 (本次或之前複製過的) 相同時才需要完整 hash
+    size_count = {}
+    for size in sizes:
+        size_count[size] = size_count.get(size, 0) + 1
+    need_hash = [size_count[size] > 1 or str(size) in size_index for size in sizes]
+    promote = [dest for size in size_count if str(size) in size_index
+               for dest in size_index[str(size)]
+               if not hash_db.execute("SELECT 1 FROM h WHERE dest = ?", (dest,)).fetchone()]
+
+    # hash + EXIF 分散到各核心, 複製與去重留在主程序
+    # fork 出來的 worker 不能和主程序共用 ZipFile 的檔案位置, 先各自關掉
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker, initargs=(HASH_ALGO,)) as ex:
+        for dest, h in ex.map(promote_hash, promote, chunksize=32):
+            if h:
+                add_hash(h, dest)
+        results = ex.map(analyze_media, tasks, need_hash, known, mtimes, sidecar_paths, chunksize=32)
+        for result, size, key in zip(results, sizes, keys):
             try:
-                if f.lower().endswith(".zip"):
-                    process_zip(path)
-                elif f.lower().endswith(MEDIA_EXT):
-                    process_media(path)
+                dest = process_media(*result, size)
             except Exception as e:
-                corrupted_exif_files.append(f"{path} | UNKNOWN | {e}")
-
-    with open(HASH_DB, "w", encoding="utf-8") as f:
-        json.dump(hash_index, f, indent=2)
+                corrupted_exif_files.add(
+                    f"{source_name(result[0])} | UNKNOWN | {e}"
+                )
+                continue
+            h = result[1]
+            if h:
+                stat_index[key] = h
+            elif dest:
+                stat_index[key] = "@" + dest
+    close_zips()
+
+    hash_db.close()
+    dump_json(stat_index, STAT_DB)
 
     def dump(p, data):
-        with open(p, "w", encoding="utf-8") as f:
-            f.write("\n".join(sorted(set(data))))
+        # 排序後逐行寫出, 不再組一個跟整份清單一樣大的字串
+        with open(p, "w", encoding="utf-8", buffering=REPORT_BUF) as f:
+            f.writelines(s + "\n" for s in sorted(data))
 
     dump(DUP_FILE, duplicate_files)
     dump(UNCLASS_FILE, unclassified_files)